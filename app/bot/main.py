@@ -2,16 +2,23 @@ import os
 import re
 import io
 import csv
+import gzip
 import hmac
+import html
 import time
 import asyncio
 import logging
-from typing import Optional, Tuple, List, Dict
-
-import requests
-from fastapi import FastAPI, HTTPException, Response
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Optional, Tuple, List, Dict, Iterator, Set
+
+import httpx
+import orjson
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
+from fastapi.middleware.gzip import GZipMiddleware
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.client.default import DefaultBotProperties
@@ -23,9 +30,10 @@ from aiogram.types import (
 )
 
 from .storage import (
-    init_db, connect,
-    save_event, delete_event,
-    save_live_start, save_live_update, stop_live
+    init_db, fetch_geojson_bytes, COORD_DIGITS,
+    save_events, delete_event,
+    save_live_start, save_live_updates, stop_live,
+    purge_expired_live, data_version
 )
 
 # ---------------------- config ----------------------
@@ -37,7 +45,11 @@ if not TOKEN:
     raise RuntimeError("TELEGRAM_TOKEN is not set")
 
 SECRET_KEY = os.getenv("SECRET_KEY", "dev")
+_SECRET = SECRET_KEY.encode()
 BASE_URL = os.getenv("BASE_URL", "http://localhost:8000").rstrip("/")
+# BASE_URL не меняется после импорта — собираем шаблоны ссылок один раз
+_MAP_URL = (BASE_URL + "/?uid={}&sig={}").format
+_PICK_URL = (BASE_URL + "/pick?uid={}&sig={}").format
 
 CENTER_LAT = float(os.getenv("CENTER_LAT", "42.179"))
 CENTER_LON = float(os.getenv("CENTER_LON", "18.942"))
@@ -49,16 +61,75 @@ NASA_API_KEY = os.getenv("NASA_API_KEY", "").strip()
 FIRMS_BBOX = os.getenv("FIRMS_BBOX", "18.3,41.8,20.4,43.6")
 FIRMS_DAYS = int(os.getenv("FIRMS_DAYS", "1"))
 
+FLUSH_SEC = 0.5
+EVENT_BATCH = 32
+LIVE_GC_SEC = 300  # /geojson и так фильтрует истёкшие, чистка нужна только против роста таблицы
+GEOJSON_TTL = 1.0  # сек; кроме записей, /geojson меняется только по истечению live_until
+GZIP_LEVEL = 5
+
+# "42.179, 18.942" / "42.179;18.942" / "42.179 18.942" — якорь и ограничение цифр против патологического ввода
+COORD_RE = re.compile(r"^\s*(-?\d{1,3}(?:\.\d+)?)\s*[,;\s]\s*(-?\d{1,3}(?:\.\d+)?)\s*$")
+
+# ---------------------- DB executor ----------------------
+# sqlite3 блокирующий: все обращения к БД — в свой маленький пул, не в общий default executor.
+# Двух потоков хватает: писатель в SQLite всё равно один, а у каждого потока своё read()-соединение.
+_DB_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="db")
+
+async def _db(fn, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(_DB_POOL, functools.partial(fn, *args, **kwargs))
+
 # ---------------------- ASGI app ----------------------
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_db()
+    log.info("DB ready")
+    app.state.http = httpx.AsyncClient(timeout=15)
+    log.info("Start polling")
+    # сигналы обрабатывает uvicorn, задачи гасим сами при выходе из lifespan
+    tasks = [
+        asyncio.create_task(dp.start_polling(bot, handle_signals=False)),
+        asyncio.create_task(_flush_loop()),
+        asyncio.create_task(_live_gc_loop()),
+    ]
+    try:
+        yield
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await _flush_events()
+        await _flush_live()
+        await app.state.http.aclose()
+        await bot.session.close()
+        await bot_files.session.close()
+        _DB_POOL.shutdown(wait=True)
+        log.info("Stopped")
+
+app = FastAPI(lifespan=lifespan)
+# GeoJSON с повторяющимися "type":"Feature" жмётся в разы — заметно на мобильном интернете
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=GZIP_LEVEL)
 ASSETS_DIR = os.path.join(os.path.dirname(__file__), "..", "webmap")
-app.mount("/assets", StaticFiles(directory=ASSETS_DIR), name="assets")
 
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles + Cache-Control: ETag/Last-Modified ставит Starlette, браузер ходит условным GET."""
+
+    def file_response(self, *args, **kwargs) -> Response:
+        resp = super().file_response(*args, **kwargs)
+        resp.headers["Cache-Control"] = "public, max-age=86400"
+        return resp
+
+app.mount("/assets", CachedStaticFiles(directory=ASSETS_DIR), name="assets")
+
+@functools.lru_cache(maxsize=None)
+def _read_asset(name: str) -> str:
+    # каталог webmap маленький и неизменный при работе — читаем каждый файл один раз
+    with open(os.path.join(ASSETS_DIR, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+@functools.lru_cache(maxsize=1)
 def _render_index() -> str:
-    path = os.path.join(ASSETS_DIR, "index.html")
-    with open(path, "r", encoding="utf-8") as f:
-        html = f.read()
-    return (html
+    page = _read_asset("index.html")
+    return (page
             .replace("const DEFAULT_CENTER = [42.179, 18.942];", f"const DEFAULT_CENTER = [{CENTER_LAT}, {CENTER_LON}];")
             .replace("const DEFAULT_ZOOM   = 12;", f"const DEFAULT_ZOOM   = {CENTER_ZOOM};")
             .replace('const MAP_TILER_KEY  = "SC5bBhZz9sPQyDQTyEez";', f'const MAP_TILER_KEY  = "{MAP_TILER_KEY or "disable"}";')
@@ -69,18 +140,16 @@ def _render_pick(uid: Optional[int], sig: Optional[str], init_lat: Optional[floa
     Вставляем центр/зум/ключ и ссылку "Open live map" с uid/sig.
     Начальная позиция булавки — либо lat/lon из query, либо дефолтный центр.
     """
-    path = os.path.join(ASSETS_DIR, "pick.html")
-    with open(path, "r", encoding="utf-8") as f:
-        html = f.read()
+    page = _read_asset("pick.html")
 
     openmap_url = BASE_URL
     if uid and sig:
-        openmap_url = f"{BASE_URL}/?uid={uid}&sig={sig}"
+        openmap_url = _MAP_URL(uid, sig)
 
     lat = init_lat if init_lat is not None else CENTER_LAT
     lon = init_lon if init_lon is not None else CENTER_LON
 
-    return (html
+    return (page
             .replace("__INIT_LAT__", str(lat))
             .replace("__INIT_LON__", str(lon))
             .replace("__CENTER_LAT__", str(CENTER_LAT))
@@ -105,52 +174,44 @@ async def healthz():
     return {"ok": True, "time": int(time.time())}
 
 # ---------------------- GeoJSON API ----------------------
-def _feat_event(row) -> Dict:
-    return {
-        "type": "Feature",
-        "geometry": {"type": "Point", "coordinates": [float(row["lon"]), float(row["lat"])]},
-        "properties": {
-            "id": int(row["id"]),
-            "type": str(row["type"]),
-            "user_id": int(row["user_id"]),
-            "contact": row["username"],
-            "text": row["text"],
-            "photo_file_id": row["photo_file_id"],
-            "ts": int(row["ts"]),
-        },
-    }
-
-def _feat_live(row) -> Dict:
-    fid = -int(row["user_id"])  # стабильный отрицательный id
-    return {
-        "type": "Feature",
-        "geometry": {"type": "Point", "coordinates": [float(row["lon"]), float(row["lat"])]},
-        "properties": {
-            "id": fid,
-            "type": "volunteer_live",
-            "user_id": int(row["user_id"]),
-            "contact": row["username"],
-            "text": None,
-            "photo_file_id": None,
-            "ts": int(row["ts"]),
-            "live_until": int(row["live_until"]),
-        },
-    }
+def _json(data) -> Response:
+    # Готовые байты orjson: FastAPI не гоняет dict через jsonable_encoder
+    return Response(content=orjson.dumps(data), media_type="application/json")
+
+# (monotonic-время сборки, data_version на момент сборки, готовые байты, они же в gzip или None)
+_geojson_cache: Tuple[float, int, bytes, Optional[bytes]] = (0.0, -1, b"", None)
+# пересобирает один запрос, остальные ждут его результат, а не сканируют БД параллельно
+_geojson_lock = asyncio.Lock()
+
+def _geojson_fresh() -> bool:
+    built, ver, _, _ = _geojson_cache
+    return ver == data_version() and time.monotonic() - built < GEOJSON_TTL
+
+def _build_geojson() -> Tuple[bytes, Optional[bytes]]:
+    # сжимаем один раз при сборке (в потоке пула), а не в GZipMiddleware на event loop при каждом запросе
+    body = fetch_geojson_bytes()
+    return body, (gzip.compress(body, GZIP_LEVEL) if len(body) >= 1024 else None)
 
 @app.get("/geojson")
-async def geojson():
-    feats: List[Dict] = []
-    with connect() as con:
-        cur = con.cursor()
-        cur.execute("SELECT id,type,user_id,username,lat,lon,ts,text,photo_file_id FROM events ORDER BY ts DESC;")
-        feats.extend(_feat_event(r) for r in cur.fetchall())
-        cur.execute("SELECT user_id,username,lat,lon,ts,live_until FROM live WHERE live_until >= ?", (int(time.time()),))
-        feats.extend(_feat_live(r) for r in cur.fetchall())
-    return {"type": "FeatureCollection", "features": feats}
+async def geojson(request: Request):
+    global _geojson_cache
+    if not _geojson_fresh():
+        async with _geojson_lock:
+            if not _geojson_fresh():  # пока ждали блокировку, кеш мог пересобрать другой запрос
+                now, ver = time.monotonic(), data_version()
+                body, gz = await _db(_build_geojson)
+                _geojson_cache = (now, ver, body, gz)
+    _, _, body, gz = _geojson_cache
+    if gz is not None and "gzip" in request.headers.get("accept-encoding", ""):
+        # с уже выставленным Content-Encoding GZipMiddleware ответ не трогает
+        return Response(content=gz, media_type="application/json",
+                        headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"})
+    return Response(content=body, media_type="application/json")
 
 # ---------------------- deletion APIs ----------------------
+@functools.lru_cache(maxsize=4096)
 def _sign(uid: int) -> str:
-    return hmac.new(SECRET_KEY.encode(), f"{uid}:{SECRET_KEY}".encode(), "sha256").hexdigest()
+    return hmac.new(_SECRET, b"%d:" % uid + _SECRET, "sha256").hexdigest()
 
 def _check(uid: int, sig: str) -> bool:
     try:
@@ -162,15 +223,15 @@ def _check(uid: int, sig: str) -> bool:
 async def api_delete_event(event_id: int, uid: Optional[int] = None, sig: Optional[str] = None):
     if uid is None or sig is None or not _check(int(uid), sig):
         raise HTTPException(status_code=403, detail="bad signature")
-    ok = delete_event(event_id, int(uid))
+    ok = await _db(delete_event, event_id, int(uid))
     return {"ok": ok}
 
 @app.delete("/live/{user_id}")
 async def api_delete_live(user_id: int, uid: Optional[int] = None, sig: Optional[str] = None):
     if uid is None or sig is None or int(uid) != int(user_id) or not _check(int(uid), sig):
         raise HTTPException(status_code=403, detail="bad signature")
-    stop_live(int(user_id))
-    return {"ok": True}
+    ok = await _db(stop_live, int(user_id))
+    return {"ok": ok}
 
 # ---------------------- photos (Telegram proxy) ----------------------
 def make_bot(token: str) -> Bot:
@@ -202,79 +263,167 @@ def _firms_urls() -> List[str]:
         f"https://firms.modaps.eosdis.nasa.gov/api/area/csv/{NASA_API_KEY}/MODIS_NRT/{bbox}/{days}",
     ]
 
-def _csv_to_features(text: str) -> List[Dict]:
-    feats: List[Dict] = []
-    reader = csv.DictReader(io.StringIO(text))
+def _csv_to_features(text: str, seen: Set[Tuple]) -> Iterator[Dict]:
+    """Фичи из CSV FIRMS; точки, уже попавшие в seen (другой спутник/лента), пропускаем."""
+    reader = csv.reader(io.StringIO(text))
+    # колонки ищем один раз по заголовку, а не через dict на каждую строку (как DictReader)
+    header = next(reader, [])
+    col = {h.strip().lower(): i for i, h in enumerate(header)}
+    i_lat = col.get("latitude", col.get("lat"))
+    i_lon = col.get("longitude", col.get("lon"))
+    if i_lat is None or i_lon is None:
+        return
+    # отсутствующая колонка -> -1, т.е. пустая ячейка, дописанная в конец строки
+    i_date, i_time, i_conf, i_inst, i_sat = (
+        col.get(k, -1) for k in ("acq_date", "acq_time", "confidence", "instrument", "satellite")
+    )
+    width = len(header)
+    blank = [""] * width
     for row in reader:
+        # строку выравниваем по заголовку: короткая получает пустые ячейки (как None в DictReader),
+        # так что пропускаем только строки с негодными lat/lon
+        if len(row) != width:
+            row = (row + blank)[:width]
+        row.append("")
         try:
-            lat = float(row.get("latitude") or row.get("LATITUDE") or row.get("lat") or "")
-            lon = float(row.get("longitude") or row.get("LONGITUDE") or row.get("lon") or "")
-        except Exception:
+            lat = round(float(row[i_lat]), COORD_DIGITS)
+            lon = round(float(row[i_lon]), COORD_DIGITS)
+        except ValueError:
             continue
-        props = {
-            "acq_date": row.get("acq_date") or row.get("ACQ_DATE"),
-            "acq_time": row.get("acq_time") or row.get("ACQ_TIME"),
-            "confidence": row.get("confidence") or row.get("CONFIDENCE"),
-            "src": row.get("instrument") or row.get("satellite") or "",
-        }
-        feats.append({"type": "Feature", "geometry": {"type": "Point", "coordinates": [lon, lat]}, "properties": props})
-    return feats
+        acq_date = row[i_date] or None
+        acq_time = row[i_time] or None
+        confidence = row[i_conf] or None
+        src = row[i_inst] or row[i_sat]
+        key = (lat, lon, acq_date, acq_time)
+        if key in seen:
+            continue
+        seen.add(key)
+        props = {"acq_date": acq_date, "acq_time": acq_time, "confidence": confidence, "src": src}
+        yield {"type": "Feature", "geometry": {"type": "Point", "coordinates": [lon, lat]}, "properties": props}
 
 @app.get("/hotspots")
 async def hotspots():
     urls = _firms_urls()
     if not urls:
-        return {"type": "FeatureCollection", "features": []}
+        return _json({"type": "FeatureCollection", "features": []})
     features: List[Dict] = []
+    seen: Set[Tuple] = set()
     for u in urls:
         try:
-            r = requests.get(u, timeout=15)
+            r = await app.state.http.get(u)
             if r.status_code == 200 and r.text.strip():
-                features.extend(_csv_to_features(r.text))
+                features.extend(_csv_to_features(r.text, seen))
         except Exception as e:
             log.warning("FIRMS fetch failed %s: %s", u, e)
-    return {"type": "FeatureCollection", "features": features}
+    return _json({"type": "FeatureCollection", "features": features})
 
 @app.get("/hotspots/debug")
 async def hotspots_debug():
-    return {"urls": _firms_urls(), "has_key": bool(NASA_API_KEY), "bbox": FIRMS_BBOX, "days": FIRMS_DAYS}
+    return _json({"urls": _firms_urls(), "has_key": bool(NASA_API_KEY), "bbox": FIRMS_BBOX, "days": FIRMS_DAYS})
 
 # ---------------------- bot (aiogram) ----------------------
 bot = make_bot(TOKEN)
 dp = Dispatcher()
 
-def _kb_main() -> ReplyKeyboardMarkup:
-    kb = [
-        [KeyboardButton(text="📍 Send my location", request_location=True)],
-        [KeyboardButton(text="🟢 Share live location")],
-        [KeyboardButton(text="🔥 Report fire")],
-        [KeyboardButton(text="🌍 Open live map")],
-    ]
-    return ReplyKeyboardMarkup(keyboard=kb, resize_keyboard=True)
+# Клавиатуры неизменяемы после сборки (pydantic-модели aiogram), поэтому строим их один раз
+_KB_MAIN = ReplyKeyboardMarkup(keyboard=[
+    [KeyboardButton(text="📍 Send my location", request_location=True)],
+    [KeyboardButton(text="🟢 Share live location")],
+    [KeyboardButton(text="🔥 Report fire")],
+    [KeyboardButton(text="🌍 Open live map")],
+], resize_keyboard=True)
 
+@functools.lru_cache(maxsize=4096)
 def _map_btn(uid: int) -> InlineKeyboardMarkup:
     sig = _sign(uid)
-    url = f"{BASE_URL}/?uid={uid}&sig={sig}"
+    url = _MAP_URL(uid, sig)
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🌍 Open live map", url=url)]
     ])
 
+@functools.lru_cache(maxsize=4096)
+def _map_link(uid: int) -> str:
+    return f'<a href="{html.escape(_MAP_URL(uid, _sign(uid)))}">🌍 Open the live map</a>'
+
+async def _answer_with_map(msg: Message, text: str) -> None:
+    # Одно сообщение вместо двух: у сообщения может быть только одна клавиатура,
+    # поэтому reply-меню оставляем, а ссылку на карту кладём в текст (parse_mode=HTML)
+    await msg.answer(f"{text}\n{_map_link(msg.from_user.id)}",
+                     reply_markup=_KB_MAIN, disable_web_page_preview=True)
+
+@functools.lru_cache(maxsize=4096)
 def _pick_btn(uid: int) -> InlineKeyboardMarkup:
     sig = _sign(uid)
-    url = f"{BASE_URL}/pick?uid={uid}&sig={sig}"
+    url = _PICK_URL(uid, sig)
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="📌 Open picker", url=url)]
     ])
 
 def _user_contact(m: Message) -> str:
-    if m.from_user.username:
-        return f"@{m.from_user.username}"
-    return m.from_user.full_name or str(m.from_user.id)
+    u = m.from_user
+    un = u.username
+    return ("@" + un) if un else (u.full_name or str(u.id))
+
+# ---- буферы записи: пишем в SQLite пачками раз в FLUSH_SEC ----
+# Telegram шлёт правку live-локации раз в несколько секунд на каждого пользователя:
+# копим только последнюю позицию по uid; время ставит сброс, одно на всю пачку
+LIVE_BUFFER: Dict[int, Tuple[float, float]] = {}
+# новые точки копим в очередь; при EVENT_BATCH штук сбрасываем, не дожидаясь таймера
+EVENT_QUEUE: List[Tuple] = []
+
+async def _queue_event(type: str, user_id: int, username: str, lat: float, lon: float,
+                       ts: int, text: Optional[str], photo_file_id: Optional[str]) -> None:
+    EVENT_QUEUE.append((type, user_id, username, lat, lon, ts, text, photo_file_id))
+    if len(EVENT_QUEUE) >= EVENT_BATCH:
+        await _flush_events()
+
+async def _flush_events() -> None:
+    """Сбрасывает очередь в БД. Не бросает: вызывается и из хендлеров, и при остановке."""
+    if not EVENT_QUEUE:
+        return
+    rows = EVENT_QUEUE[:]
+    EVENT_QUEUE.clear()
+    try:
+        await _db(save_events, rows)
+    except Exception as e:
+        # пользователям уже ответили «сохранено» — возвращаем строки в начало очереди до следующего сброса
+        EVENT_QUEUE[:0] = rows
+        log.error("event flush failed, %d rows kept for retry: %s", len(rows), e)
+
+async def _flush_live() -> None:
+    """Сбрасывает буфер live-позиций; как и _flush_events, не бросает."""
+    if not LIVE_BUFFER:
+        return
+    ts = int(time.time())
+    rows = [(lat, lon, ts, uid) for uid, (lat, lon) in LIVE_BUFFER.items()]
+    LIVE_BUFFER.clear()
+    try:
+        await _db(save_live_updates, rows)
+    except Exception as e:
+        # возвращаем позиции в буфер, но не перетираем более свежие, пришедшие во время записи
+        for lat, lon, _, uid in rows:
+            LIVE_BUFFER.setdefault(uid, (lat, lon))
+        log.error("live flush failed, %d positions kept for retry: %s", len(rows), e)
+
+async def _flush_loop() -> None:
+    while True:
+        await asyncio.sleep(FLUSH_SEC)
+        await _flush_events()
+        await _flush_live()
+
+async def _live_gc_loop() -> None:
+    while True:
+        await asyncio.sleep(LIVE_GC_SEC)
+        try:
+            removed = await _db(purge_expired_live)
+            if removed:
+                log.info("Purged %d expired live locations", removed)
+        except Exception as e:
+            log.warning("live gc failed: %s", e)
 
 @dp.message(CommandStart(), F.chat.type.in_({ChatType.PRIVATE}))
 async def on_start_cmd(msg: Message):
-    await msg.answer("Hi! Choose an action:", reply_markup=_kb_main())
-    await msg.answer("Open the live map:", reply_markup=_map_btn(msg.from_user.id))
+    await _answer_with_map(msg, "Hi! Choose an action:")
 
 # ---- единый обработчик любой локации ----
 @dp.message(F.content_type == ContentType.LOCATION)
@@ -287,36 +436,31 @@ async def on_any_location(msg: Message):
     now = int(time.time())
 
     if isinstance(lp, int) and lp > 0:
-        save_live_start(
+        LIVE_BUFFER.pop(uid, None)  # старое обновление из буфера не должно перетереть новый старт
+        await _db(
+            save_live_start,
             uid=uid,
             username=_user_contact(msg),
             lat=lat, lon=lon,
             ts=now,
             live_until=now + lp
         )
-        await msg.answer("Live location started 🟢", reply_markup=_kb_main())
+        await _answer_with_map(msg, "Live location started 🟢")
     else:
-        save_event(
+        await _queue_event(
             type="volunteer",
             user_id=uid,
             username=_user_contact(msg),
             lat=lat, lon=lon,
             ts=now, text=None, photo_file_id=None
         )
-        await msg.answer("Location saved ✅", reply_markup=_kb_main())
-
-    await msg.answer("Open the live map:", reply_markup=_map_btn(uid))
+        await _answer_with_map(msg, "Location saved ✅")
 
 @dp.edited_message(F.content_type == ContentType.LOCATION)
 async def live_update(msg: Message):
     if not msg.location:
         return
-    save_live_update(
-        uid=msg.from_user.id,
-        lat=msg.location.latitude,
-        lon=msg.location.longitude,
-        ts=int(time.time())
-    )
+    LIVE_BUFFER[msg.from_user.id] = (msg.location.latitude, msg.location.longitude)
 
 # 3) report fire -> picker + coords/photo/text
 from aiogram.fsm.context import FSMContext
@@ -332,7 +476,7 @@ async def fire_begin(msg: Message, state: FSMContext):
     await msg.answer("Open picker and paste coordinates here, or send a location.", reply_markup=_pick_btn(msg.from_user.id))
 
 def _parse_coords(text: str) -> Optional[Tuple[float, float]]:
-    m = re.search(r"(-?\d+(?:\.\d+)?)[,;\s]+(-?\d+(?:\.\d+)?)", text or "")
+    m = COORD_RE.match(text or "")
     if not m: return None
     lat, lon = float(m.group(1)), float(m.group(2))
     if not (-90 <= lat <= 90 and -180 <= lon <= 180):
@@ -343,7 +487,7 @@ def _parse_coords(text: str) -> Optional[Tuple[float, float]]:
 async def fire_coords_from_loc(msg: Message, state: FSMContext):
     await state.update_data(coords=(msg.location.latitude, msg.location.longitude))
     await state.set_state(AddFire.awaiting_optional)
-    await msg.answer("Got coordinates. Send photo and/or text (optional) or 'OK' to finish.", reply_markup=_kb_main())
+    await msg.answer("Got coordinates. Send photo and/or text (optional) or 'OK' to finish.", reply_markup=_KB_MAIN)
 
 @dp.message(AddFire.awaiting_coords, F.text)
 async def fire_coords_from_text(msg: Message, state: FSMContext):
@@ -352,7 +496,7 @@ async def fire_coords_from_text(msg: Message, state: FSMContext):
         return await msg.answer("Send coordinates like <code>42.179, 18.942</code> or share a location.")
     await state.update_data(coords=pts)
     await state.set_state(AddFire.awaiting_optional)
-    await msg.answer("Got coordinates. Send photo and/or text (optional) or 'OK' to finish.", reply_markup=_kb_main())
+    await msg.answer("Got coordinates. Send photo and/or text (optional) or 'OK' to finish.", reply_markup=_KB_MAIN)
 
 @dp.message(AddFire.awaiting_optional, F.photo | F.text)
 async def fire_finish(msg: Message, state: FSMContext):
@@ -360,7 +504,7 @@ async def fire_finish(msg: Message, state: FSMContext):
     coords = data.get("coords")
     if not coords:
         await state.clear()
-        return await msg.answer("Cancelled.", reply_markup=_kb_main())
+        return await msg.answer("Cancelled.", reply_markup=_KB_MAIN)
 
     lat, lon = coords
     text = None
@@ -372,26 +516,16 @@ async def fire_finish(msg: Message, state: FSMContext):
     elif msg.text and msg.text.lower() != "ok":
         text = msg.text
 
-    save_event(
-        type="fire",
-        user_id=msg.from_user.id,
-        username=_user_contact(msg),
-        lat=lat, lon=lon, ts=int(time.time()),
-        text=text, photo_file_id=photo_id
-    )
+    # пожар — редкое и самое важное событие: пишем сразу, очередь — только запасной путь при сбое БД
+    row = ("fire", msg.from_user.id, _user_contact(msg), lat, lon, int(time.time()), text, photo_id)
+    try:
+        await _db(save_events, [row])
+    except Exception as e:
+        log.error("fire report write failed, queued for retry: %s", e)
+        EVENT_QUEUE.append(row)
     await state.clear()
-    await msg.answer("Fire point added 🔥✅", reply_markup=_kb_main())
-    await msg.answer("Open the live map:", reply_markup=_map_btn(msg.from_user.id))
+    await _answer_with_map(msg, "Fire point added 🔥✅")
 
 @dp.message(F.text == "🌍 Open live map")
 async def open_map(msg: Message):
     await msg.answer("Open the live map:", reply_markup=_map_btn(msg.from_user.id))
-
-# ---------------------- background: start polling ----------------------
-@app.on_event("startup")
-async def _startup():
-    init_db()
-    log.info("DB ready")
-    loop = asyncio.get_event_loop()
-    log.info("Start polling")
-    loop.create_task(dp.start_polling(bot))
@@ -1,8 +1,13 @@
 import os
+import pathlib
 import sqlite3
+import time
 import logging
+import threading
 from contextlib import contextmanager
-from typing import Optional
+from typing import Optional, Iterable, Iterator, Tuple, Dict
+
+import orjson
 
 # Включим простой логгер (Railway подхватит stdout)
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -25,28 +30,27 @@ def _ensure_parent_dir(path: str) -> None:
         logging.warning("Cannot create directory %s: %s", parent, e)
 
 
-def _try_open(path: str) -> Optional[sqlite3.Connection]:
+def _writable(path: str) -> bool:
     """
-    Пытаемся открыть/создать БД по указанному пути.
-    Возвращаем соединение или None при ошибке.
+    Можно ли держать БД по этому пути. Каталог нужен на запись всегда: WAL создаёт рядом
+    -wal/-shm; сам файл — если он уже есть. Недостающий каталог создаём (как и раньше),
+    а вместо пробного открытия SQLite — только os.access.
     """
-    try:
-        _ensure_parent_dir(path)
-        # небольшие опции для стабильности
-        con = sqlite3.connect(path, timeout=10, check_same_thread=False)
-        return con
-    except Exception as e:
-        logging.warning("DB open failed for %s: %s", path, e)
-        return None
+    if path == ":memory:":
+        return True
+    _ensure_parent_dir(path)
+    if os.access(os.path.dirname(path) or ".", os.W_OK) and (
+            not os.path.exists(path) or os.access(path, os.W_OK)):
+        return True
+    logging.warning("DB location not writable: %s", path)
+    return False
 
 
 def _pick_db_path() -> str:
     # сначала путь из ENV
     candidates = [PRIMARY_DB_PATH] + [p for p in FALLBACK_PATHS if p != PRIMARY_DB_PATH]
     for p in candidates:
-        con = _try_open(p)
-        if con is not None:
-            con.close()
+        if _writable(p):
             logging.info("Using SQLite DB at: %s", p)
             return p
     # если совсем ничего не вышло — последний шанс /tmp
@@ -57,86 +61,279 @@ def _pick_db_path() -> str:
 # Выбираем рабочий путь один раз на импорт модуля
 DB_PATH = _pick_db_path()
 
+COORD_DIGITS = 4  # ~11 м — точнее карта всё равно не покажет, а JSON заметно короче
+
+
+# Одно соединение на процесс: прагмы и кеш страниц/стейтментов живут всё время работы
+_conn: Optional[sqlite3.Connection] = None
+_lock = threading.RLock()
+# Счётчик изменений: растёт на каждой записи, по нему main.py сбрасывает кеш /geojson
+_version = 0
+
+
+def _changed() -> None:
+    global _version
+    _version += 1
+
+
+def data_version() -> int:
+    return _version
+
+
+def _open(readonly: bool = False) -> sqlite3.Connection:
+    # isolation_level=None: одиночные запросы идут в autocommit, без неявного BEGIN/COMMIT
+    target, uri = DB_PATH, False
+    if readonly:
+        # mode=ro: такое соединение физически не может взять write-lock
+        target, uri = pathlib.Path(DB_PATH).absolute().as_uri() + "?mode=ro", True
+    con = sqlite3.connect(target, timeout=10, check_same_thread=False, isolation_level=None,
+                          cached_statements=256, uri=uri)
+    con.row_factory = sqlite3.Row
+    # Настройки соединения (journal_mode=WAL хранится в самом файле и ставится в init_db).
+    # NORMAL в WAL — без fsync на каждый коммит; busy-timeout задаёт timeout=10 выше.
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute("PRAGMA temp_store=MEMORY")
+    con.execute("PRAGMA cache_size=-64000")
+    con.execute("PRAGMA mmap_size=268435456")
+    return con
+
 
 @contextmanager
 def connect():
-    con = sqlite3.connect(DB_PATH, timeout=10, check_same_thread=False)
-    con.row_factory = sqlite3.Row
-    try:
-        yield con
-        con.commit()
-    finally:
-        con.close()
+    global _conn
+    with _lock:
+        if _conn is None:
+            _conn = _open()
+        yield _conn
+
+
+# Читателям — своё read-only соединение на поток: в WAL они не ждут писателя, и _lock им не нужен.
+# Писатель один и делится между потоками пула, поэтому его транзакции по-прежнему сериализует _lock.
+_local = threading.local()
+
+
+@contextmanager
+def read():
+    if DB_PATH == ":memory:":
+        # у каждого соединения с :memory: своя пустая база — читаем через писателя
+        with connect() as con:
+            yield con
+        return
+    con = getattr(_local, "con", None)
+    if con is None:
+        con = _local.con = _open(readonly=True)
+    yield con
+
+
+@contextmanager
+def transaction():
+    """Явная транзакция для нескольких запросов, которые должны пройти атомарно."""
+    with connect() as con:
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            yield con
+            con.execute("COMMIT")
+            _changed()
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+
+
+# Меняя SCHEMA_SQL, увеличивайте SCHEMA_VERSION — иначе init_db на старой базе DDL не выполнит
+SCHEMA_VERSION = 1
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS events(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT NOT NULL,                 -- 'volunteer' | 'fire'
+    user_id INTEGER NOT NULL,
+    username TEXT,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    ts INTEGER NOT NULL,
+    text TEXT,
+    photo_file_id TEXT
+);
+CREATE TABLE IF NOT EXISTS live(
+    user_id INTEGER PRIMARY KEY,
+    username TEXT,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    ts INTEGER NOT NULL,
+    live_until INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_live_until ON live(live_until);
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events(ts DESC);
+"""
+
+
+# Запросы записи — одни и те же строки, чтобы кеш подготовленных стейтментов sqlite3 попадал
+_SQL_INSERT_EVENT = "INSERT INTO events(type,user_id,username,lat,lon,ts,text,photo_file_id) VALUES(?,?,?,?,?,?,?,?)"
+_SQL_UPSERT_LIVE = """
+    INSERT INTO live(user_id, username, lat, lon, ts, live_until)
+    VALUES(?,?,?,?,?,?)
+    ON CONFLICT(user_id) DO UPDATE SET
+      username=excluded.username,
+      lat=excluded.lat, lon=excluded.lon,
+      ts=excluded.ts, live_until=excluded.live_until
+"""
+_SQL_UPDATE_LIVE = "UPDATE live SET lat=?, lon=?, ts=? WHERE user_id=?"
+_SQL_DELETE_EVENT = "DELETE FROM events WHERE id=? AND user_id=?"
+_SQL_DELETE_LIVE = "DELETE FROM live WHERE user_id=?"
+_SQL_PURGE_LIVE = "DELETE FROM live WHERE live_until < ?"
+
+# Зеркало таблицы live в памяти: uid -> (username, lat, lon, ts, live_until).
+# Таблица крошечная (строка на активного волонтёра) и почти целиком перезаписывается,
+# поэтому /geojson берёт live отсюда, а SQLite остаётся для надёжности между рестартами.
+# Меняется только под _lock вместе с записью в БД и после её успеха.
+_live: Dict[int, Tuple[str, float, float, int, int]] = {}
 
 
 def init_db():
     with connect() as con:
-        cur = con.cursor()
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS events(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            type TEXT NOT NULL,                 -- 'volunteer' | 'fire'
-            user_id INTEGER NOT NULL,
-            username TEXT,
-            lat REAL NOT NULL,
-            lon REAL NOT NULL,
-            ts INTEGER NOT NULL,
-            text TEXT,
-            photo_file_id TEXT
-        )
-        """)
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS live(
-            user_id INTEGER PRIMARY KEY,
-            username TEXT,
-            lat REAL NOT NULL,
-            lon REAL NOT NULL,
-            ts INTEGER NOT NULL,
-            live_until INTEGER NOT NULL
-        )
-        """)
-        con.commit()
+        (version,) = con.execute("PRAGMA user_version").fetchone()
+        if version != SCHEMA_VERSION:
+            if DB_PATH != ":memory:":
+                # WAL: читатели не блокируют писателя; режим сохраняется в файле БД
+                con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(SCHEMA_SQL)
+            con.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        # обновляет статистику планировщика только там, где она устарела (дешевле полного ANALYZE)
+        con.execute("PRAGMA optimize")
+        _live.clear()
+        for uid, username, lat, lon, ts, live_until in con.execute(
+                "SELECT user_id,username,lat,lon,ts,live_until FROM live"):
+            _live[uid] = (username, lat, lon, ts, live_until)
         logging.info("DB ready at %s", DB_PATH)
 
 
-def save_event(type: str, user_id: int, username: str, lat: float, lon: float,
-               ts: int, text: Optional[str], photo_file_id: Optional[str]) -> int:
-    with connect() as con:
-        cur = con.cursor()
-        cur.execute(
-            "INSERT INTO events(type,user_id,username,lat,lon,ts,text,photo_file_id) VALUES(?,?,?,?,?,?,?,?)",
-            (type, user_id, username, lat, lon, ts, text, photo_file_id)
-        )
-        return cur.lastrowid
+def save_events(rows: Iterable[Tuple]):
+    """Пачка строк (type, user_id, username, lat, lon, ts, text, photo_file_id) одной транзакцией."""
+    with transaction() as con:
+        con.executemany(_SQL_INSERT_EVENT, rows)
 
 
 def delete_event(event_id: int, owner_id: int) -> bool:
     with connect() as con:
-        cur = con.cursor()
-        cur.execute("DELETE FROM events WHERE id=? AND user_id=?", (event_id, owner_id))
-        return cur.rowcount > 0
+        cur = con.execute(_SQL_DELETE_EVENT, (event_id, owner_id))
+        if cur.rowcount <= 0:
+            return False  # чужая или уже удалённая точка — кеш /geojson не трогаем
+        _changed()
+        return True
 
 
 def save_live_start(uid: int, username: str, lat: float, lon: float, ts: int, live_until: int):
     with connect() as con:
-        cur = con.cursor()
-        cur.execute("""
-            INSERT INTO live(user_id, username, lat, lon, ts, live_until)
-            VALUES(?,?,?,?,?,?)
-            ON CONFLICT(user_id) DO UPDATE SET
-              username=excluded.username,
-              lat=excluded.lat, lon=excluded.lon,
-              ts=excluded.ts, live_until=excluded.live_until
-        """, (uid, username, lat, lon, ts, live_until))
-
-
-def save_live_update(uid: int, lat: float, lon: float, ts: int):
+        con.execute(_SQL_UPSERT_LIVE, (uid, username, lat, lon, ts, live_until))
+        _live[uid] = (username, lat, lon, ts, live_until)
+        _changed()
+
+
+def save_live_updates(rows: Iterable[Tuple[float, float, int, int]]):
+    """Пачка (lat, lon, ts, uid) одной транзакцией — для буфера live-обновлений."""
+    rows = list(rows)
+    with connect():
+        with transaction() as con:
+            con.executemany(_SQL_UPDATE_LIVE, rows)
+        # зеркало — только после успешного COMMIT: при откате в нём не должно остаться новых позиций
+        for row in rows:
+            _mirror_update(*row)
+        _changed()  # /geojson мог пересобраться между COMMIT и обновлением зеркала
+
+
+def _mirror_update(lat: float, lon: float, ts: int, uid: int):
+    # как UPDATE ... WHERE user_id=?: неизвестный uid (трансляция уже снята) не добавляем
+    cur = _live.get(uid)
+    if cur is not None:
+        _live[uid] = (cur[0], lat, lon, ts, cur[4])
+
+
+def stop_live(uid: int) -> bool:
     with connect() as con:
-        cur = con.cursor()
-        cur.execute("UPDATE live SET lat=?, lon=?, ts=? WHERE user_id=?", (lat, lon, ts, uid))
+        cur = con.execute(_SQL_DELETE_LIVE, (uid,))
+        _live.pop(uid, None)
+        if cur.rowcount <= 0:
+            return False
+        _changed()
+        return True
 
 
-def stop_live(uid: int):
+def purge_expired_live() -> int:
+    """Удаляет истёкшие live-трансляции (range scan по idx_live_until), возвращает число строк."""
     with connect() as con:
-        cur = con.cursor()
-        cur.execute("DELETE FROM live WHERE user_id=?", (uid,))
+        now = int(time.time())
+        cur = con.execute(_SQL_PURGE_LIVE, (now,))
+        for uid in [u for u, v in _live.items() if v[4] < now]:
+            del _live[uid]
+        if cur.rowcount > 0:
+            _changed()
+        return cur.rowcount
+
+
+# ---------------------- GeoJSON ----------------------
+# Колонки типизированы (INTEGER/REAL/TEXT) — sqlite3 уже отдаёт int/float/str, приводить не нужно.
+# Координаты округляет сам SQLite (round() в C), в Python на строку остаётся только сборка dict.
+# Порядок распаковки в _feat_event совпадает с порядком колонок в SELECT.
+_SQL_GEO_EVENTS = (
+    f"SELECT id,type,user_id,username,round(lat,{COORD_DIGITS}),round(lon,{COORD_DIGITS}),ts,text,photo_file_id "
+    "FROM events ORDER BY ts DESC"
+)
+
+
+def _feat_event(row) -> Dict:
+    fid, typ, uid, contact, lat, lon, ts, text, photo_file_id = row
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [lon, lat]},
+        "properties": {
+            "id": fid,
+            "type": typ,
+            "user_id": uid,
+            "contact": contact,
+            "text": text,
+            "photo_file_id": photo_file_id,
+            "ts": ts,
+        },
+    }
+
+
+def _feat_live(uid: int, contact: str, lat: float, lon: float, ts: int, live_until: int) -> Dict:
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [round(lon, COORD_DIGITS), round(lat, COORD_DIGITS)]},
+        "properties": {
+            "id": -uid,  # стабильный отрицательный id
+            "type": "volunteer_live",
+            "user_id": uid,
+            "contact": contact,
+            "text": None,
+            "photo_file_id": None,
+            "ts": ts,
+            "live_until": live_until,
+        },
+    }
+
+
+def iter_features() -> Iterator[Dict]:
+    """Фичи по одной: все точки прямо из курсора (новые сверху), затем активные live из зеркала."""
+    with read() as con:
+        for r in con.execute(_SQL_GEO_EVENTS):
+            yield _feat_event(r)
+    now = int(time.time())
+    # снимок зеркала: list() копирует элементы под GIL, писатель может менять dict параллельно
+    for uid, (contact, lat, lon, ts, live_until) in list(_live.items()):
+        if live_until >= now:
+            yield _feat_live(uid, contact, lat, lon, ts, live_until)
+
+
+def fetch_geojson_bytes() -> bytes:
+    """FeatureCollection сразу в JSON-байтах: каждая фича кодируется orjson и дописывается в буфер,
+    так что в памяти нет одновременно всего списка dict и итогового JSON."""
+    dumps = orjson.dumps
+    buf = bytearray(b'{"type":"FeatureCollection","features":[')
+    sep = b""
+    for feat in iter_features():
+        buf += sep
+        buf += dumps(feat)
+        sep = b","
+    buf += b"]}"
+    return bytes(buf)